@@ -0,0 +1,411 @@
+import queue
+import random
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+
+import google.generativeai as genai
+
+try:
+    from google.api_core import exceptions as google_exceptions
+    GOOGLE_TRANSIENT_ERRORS = (
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.DeadlineExceeded,
+        google_exceptions.InternalServerError,
+        google_exceptions.ResourceExhausted,
+    )
+except ImportError:
+    GOOGLE_TRANSIENT_ERRORS = ()
+
+
+class AIClientError(Exception):
+    """Base class for errors raised by the AI client itself"""
+
+
+class TransientAIError(AIClientError):
+    """Error worth retrying (overload, network blip, timeout)"""
+
+
+class AIDeadlineExceeded(TransientAIError):
+    pass
+
+
+class CircuitOpenError(AIClientError):
+    """Raised without calling the model while the circuit breaker is open"""
+
+
+TRANSIENT_ERRORS = (TransientAIError, TimeoutError, ConnectionError) + GOOGLE_TRANSIENT_ERRORS
+
+
+# ============== CIRCUIT BREAKER ==============
+
+class CircuitBreaker:
+    """
+    Opens when the failure rate over the last `window` calls reaches `failure_rate`
+    (after at least `min_calls`). After `cooldown_seconds` one probe call is let
+    through; its success closes the circuit, its failure re-opens it. allow() hands
+    the probe a token that must be passed back to record(), so calls started before
+    the circuit opened can't decide the probe's outcome when they finish late.
+    """
+
+    def __init__(self, failure_rate=0.5, min_calls=10, window=20, cooldown_seconds=30):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.cooldown_seconds = cooldown_seconds
+        self._outcomes = deque(maxlen=window)
+        self._state = 'closed'
+        self._opened_at = 0.0
+        self._probe = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == 'open' and time.monotonic() - self._opened_at >= self.cooldown_seconds:
+                return 'half_open'
+            return self._state
+
+    def allow(self):
+        """Returns (allowed, probe); probe is a token for the half-open probe call, else None"""
+        with self._lock:
+            if self._state == 'closed':
+                return True, None
+            if time.monotonic() - self._opened_at < self.cooldown_seconds or self._probe is not None:
+                return False, None
+            self._probe = object()
+            return True, self._probe
+
+    def record(self, success, probe=None):
+        with self._lock:
+            if probe is not None:
+                # A stale token means this probe was already superseded; ignore it
+                if probe is self._probe:
+                    self._probe = None
+                    if success:
+                        self._state = 'closed'
+                        self._outcomes.clear()
+                    else:
+                        self._opened_at = time.monotonic()
+                return
+
+            # Calls that started before the circuit opened don't count once it is open
+            if self._state != 'closed':
+                return
+
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if (len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.failure_rate):
+                print(f"AI circuit breaker opened ({failures}/{len(self._outcomes)} recent calls failed)")
+                self._state = 'open'
+                self._opened_at = time.monotonic()
+
+
+# ============== METRICS ==============
+
+class AIMetrics:
+    def __init__(self, latency_samples=1000):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=latency_samples)
+        self.counters = {
+            'calls': 0,
+            'successes': 0,
+            'failures': 0,
+            'timeouts': 0,
+            'retries': 0,
+            'short_circuited': 0,
+        }
+
+    def increment(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def observe_latency(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds * 1000)
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            counters = dict(self.counters)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 1)
+
+        finished = counters['successes'] + counters['failures']
+        return {
+            **counters,
+            'error_rate': counters['failures'] / finished if finished else 0.0,
+            'latency_ms': {'p50': percentile(0.5), 'p95': percentile(0.95), 'p99': percentile(0.99)}
+        }
+
+
+# ============== CLIENT ==============
+
+class GeminiClient:
+    """
+    Shared wrapper around Gemini calls: per-attempt timeouts, jittered exponential
+    retries for transient errors within an overall deadline, and a circuit breaker
+    so callers reach their fallback logic immediately while the model is failing.
+    """
+
+    def __init__(self, model_factory, timeout=10.0, deadline=25.0, max_retries=2,
+                 backoff_base=0.5, backoff_max=4.0, breaker=None):
+        self.model_factory = model_factory
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = AIMetrics()
+
+    def _check_breaker(self):
+        """Raise CircuitOpenError if the call must fail fast; else return the probe token (or None)"""
+        allowed, probe = self.breaker.allow()
+        if not allowed:
+            self.metrics.increment('short_circuited')
+            raise CircuitOpenError("AI temporarily unavailable (circuit open)")
+        return probe
+
+    def _call_with_timeout(self, prompt, timeout):
+        # The SDK gets the same timeout so it cancels the HTTP call itself; the daemon thread
+        # only guards against an SDK that ignores it, and never blocks shutdown
+        results = queue.Queue()
+        request_options = {'timeout': max(timeout, 0)}
+
+        def call():
+            try:
+                results.put(('ok', self.model_factory().generate_content(prompt, request_options=request_options)))
+            except Exception as error:
+                results.put(('error', error))
+
+        threading.Thread(target=call, daemon=True).start()
+        try:
+            kind, value = results.get(timeout=max(timeout, 0))
+        except queue.Empty:
+            raise AIDeadlineExceeded(f"Gemini call exceeded {timeout:.1f}s")
+        if kind == 'error':
+            raise value
+        return value
+
+    def _backoff(self, attempt, ends_at):
+        """Sleep before the next attempt; returns False if it would overrun the deadline"""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt)) * random.uniform(0.5, 1.5)
+        if time.monotonic() + delay >= ends_at:
+            return False
+        self.metrics.increment('retries')
+        time.sleep(delay)
+        return True
+
+    def _finish(self, started, probe, error=None):
+        self.metrics.observe_latency(time.monotonic() - started)
+        if error is None:
+            self.metrics.increment('successes')
+            self.breaker.record(True, probe)
+        else:
+            self.metrics.increment('failures')
+            if isinstance(error, AIDeadlineExceeded):
+                self.metrics.increment('timeouts')
+            # Only degradation counts against the breaker; a rejected prompt means the service is up
+            self.breaker.record(not isinstance(error, TRANSIENT_ERRORS), probe)
+
+    def generate(self, prompt, timeout=None, deadline=None, on_failed_attempt=None):
+        """
+        Blocking generate_content() call; returns the Gemini response object.
+        on_failed_attempt(error) is called for every attempt that fails, retried or not.
+        """
+        probe = self._check_breaker()
+        self.metrics.increment('calls')
+        started = time.monotonic()
+        ends_at = started + (deadline or self.deadline)
+        attempt = 0
+
+        while True:
+            attempt_timeout = min(timeout or self.timeout, ends_at - time.monotonic())
+            try:
+                response = self._call_with_timeout(prompt, attempt_timeout)
+                self._finish(started, probe)
+                return response
+            except TRANSIENT_ERRORS as error:
+                print(f"Transient AI error (attempt {attempt + 1}): {error}")
+                if on_failed_attempt:
+                    on_failed_attempt(error)
+                if attempt >= self.max_retries or not self._backoff(attempt, ends_at):
+                    self._finish(started, probe, error)
+                    raise
+                attempt += 1
+            except Exception as error:
+                if on_failed_attempt:
+                    on_failed_attempt(error)
+                self._finish(started, probe, error)
+                raise
+
+    def stream(self, prompt, timeout=None, on_failed_attempt=None):
+        """
+        Streaming generate_content(). Returns an iterable of chunks that raises
+        AIDeadlineExceeded when no chunk arrives within `timeout` seconds or the whole
+        stream runs past the client's deadline. Attempts are
+        only retried before the first chunk has been handed to the caller. The circuit
+        breaker is consulted when iteration starts, so an unread stream holds no probe slot.
+        on_failed_attempt(error) is called for every attempt that fails, as in generate().
+        """
+        return GeminiStream(self, prompt, timeout or self.timeout, on_failed_attempt)
+
+
+class GeminiStream:
+    """Iterable over streamed chunks; usage_metadata is available once iteration finishes"""
+
+    def __init__(self, client, prompt, timeout, on_failed_attempt=None):
+        self.client = client
+        self.prompt = prompt
+        self.timeout = timeout
+        self.on_failed_attempt = on_failed_attempt
+        self.usage_metadata = None
+
+    def _produce(self, chunks, ends_at):
+        try:
+            # The SDK cancels the call itself once the overall deadline passes
+            request_options = {'timeout': max(ends_at - time.monotonic(), 0)}
+            response = self.client.model_factory().generate_content(
+                self.prompt, stream=True, request_options=request_options
+            )
+            for chunk in response:
+                chunks.put(('chunk', chunk))
+            chunks.put(('done', getattr(response, 'usage_metadata', None)))
+        except Exception as error:
+            chunks.put(('error', error))
+
+    def __iter__(self):
+        client = self.client
+        probe = client._check_breaker()
+        client.metrics.increment('calls')
+        started = time.monotonic()
+        ends_at = started + client.deadline
+        attempt = 0
+        yielded = False
+
+        while True:
+            chunks = queue.Queue()
+            threading.Thread(target=self._produce, args=(chunks, ends_at), daemon=True).start()
+            try:
+                while True:
+                    # Each wait is capped by the overall deadline, so a slow trickle of chunks can't run forever
+                    remaining = ends_at - time.monotonic()
+                    if remaining <= 0:
+                        raise AIDeadlineExceeded(f"Gemini stream exceeded {client.deadline:.1f}s deadline")
+                    try:
+                        kind, value = chunks.get(timeout=min(self.timeout, remaining))
+                    except queue.Empty:
+                        if self.timeout < remaining:
+                            raise AIDeadlineExceeded(f"No Gemini chunk within {self.timeout:.1f}s")
+                        raise AIDeadlineExceeded(f"Gemini stream exceeded {client.deadline:.1f}s deadline")
+                    if kind == 'error':
+                        raise value
+                    if kind == 'done':
+                        self.usage_metadata = value
+                        client._finish(started, probe)
+                        return
+                    yielded = True
+                    yield value
+            except TRANSIENT_ERRORS as error:
+                print(f"Transient AI stream error (attempt {attempt + 1}): {error}")
+                if self.on_failed_attempt:
+                    self.on_failed_attempt(error)
+                if yielded or attempt >= client.max_retries or not client._backoff(attempt, ends_at):
+                    client._finish(started, probe, error)
+                    raise
+                attempt += 1
+            except GeneratorExit:
+                # The caller stopped reading early; the model itself was responding
+                client._finish(started, probe)
+                raise
+            except Exception as error:
+                if self.on_failed_attempt:
+                    self.on_failed_attempt(error)
+                client._finish(started, probe, error)
+                raise
+
+
+# ============== LOCAL FAKE ==============
+
+class FakeGenerativeModel:
+    """
+    Stand-in for genai.GenerativeModel that injects latency and failures, for
+    exercising timeouts, retries and the circuit breaker without calling Gemini.
+    """
+
+    def __init__(self, text="This is a fake AI response.", latency=0.0, failure_rate=0.0,
+                 hang_rate=0.0, mid_stream_failure_rate=0.0, chunk_delay=0.05, rng=None):
+        self.text = text
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.hang_rate = hang_rate
+        self.mid_stream_failure_rate = mid_stream_failure_rate
+        self.chunk_delay = chunk_delay
+        self.rng = rng or random.Random()
+
+    def _usage(self, prompt):
+        return SimpleNamespace(
+            prompt_token_count=len(str(prompt)) // 4,
+            candidates_token_count=len(self.text) // 4
+        )
+
+    def _start(self, request_options):
+        time.sleep(self.latency)
+        if self.rng.random() < self.hang_rate:
+            # Like the SDK, a hung call is cancelled once the request timeout passes
+            timeout = (request_options or {}).get('timeout', 3600)
+            time.sleep(timeout)
+            raise TransientAIError(f"Injected hang from FakeGenerativeModel cancelled after {timeout:.1f}s")
+        if self.rng.random() < self.failure_rate:
+            raise TransientAIError("Injected failure from FakeGenerativeModel")
+
+    def _stream(self, prompt):
+        for word in self.text.split(' '):
+            time.sleep(self.chunk_delay)
+            if self.rng.random() < self.mid_stream_failure_rate:
+                raise TransientAIError("Injected mid-stream failure from FakeGenerativeModel")
+            yield SimpleNamespace(text=word + ' ')
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        self._start(request_options)
+        if stream:
+            return FakeStreamResponse(self._stream(prompt), self._usage(prompt))
+        return SimpleNamespace(text=self.text, usage_metadata=self._usage(prompt))
+
+
+class FakeStreamResponse:
+    def __init__(self, chunks, usage_metadata):
+        self._chunks = chunks
+        self.usage_metadata = usage_metadata
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+
+def create_ai_client(config):
+    """Build the shared client from app config; AI_BACKEND=fake uses FakeGenerativeModel"""
+    if config['AI_BACKEND'] == 'fake':
+        fake = FakeGenerativeModel(
+            latency=config['AI_FAKE_LATENCY'],
+            failure_rate=config['AI_FAKE_FAILURE_RATE']
+        )
+        model_factory = lambda: fake
+    else:
+        model_factory = lambda: genai.GenerativeModel(config['AI_MODEL'])
+
+    return GeminiClient(
+        model_factory,
+        timeout=config['AI_TIMEOUT_SECONDS'],
+        deadline=config['AI_DEADLINE_SECONDS'],
+        max_retries=config['AI_MAX_RETRIES'],
+        breaker=CircuitBreaker(
+            failure_rate=config['AI_BREAKER_FAILURE_RATE'],
+            min_calls=config['AI_BREAKER_MIN_CALLS'],
+            cooldown_seconds=config['AI_BREAKER_COOLDOWN_SECONDS']
+        )
+    )
@@ -1,17 +1,26 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt_identity
-from datetime import datetime, date, timezone
+from datetime import datetime, date, timedelta, timezone
 from sqlalchemy import text
 from werkzeug.security import check_password_hash
 import requests
 import traceback
+import json
 import google.generativeai as genai
 import os
 from dotenv import load_dotenv
 
 # Import db and models from models.py
-from models import db, User, Category, Expense, Budget
+from models import db, User, Category, Expense, Budget, RecurringCharge, ExpenseAnomaly, ArchivedExpense
+from chat_cache import ChatResponseCache, context_fingerprint, apply_token_budget, estimate_tokens
+from chat_intents import LocalIntentEngine
+from search import setup_search_index, search_expenses
+from ai_client import create_ai_client
+from archive import expenses_in_range, rollup_category_totals
+from rate_limit import (
+    RateLimiter, create_bucket_store, failed_attempt_recorder, record_model_call, token_counts, usage_summary
+)
 
 load_dotenv() # Load environment variables from .env file
 
@@ -22,11 +31,31 @@ app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///finance_tracker.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'jwt-secret-string')
+app.config['CHAT_CACHE_TTL_SECONDS'] = int(os.getenv('CHAT_CACHE_TTL_SECONDS', 3600))
+app.config['CHAT_CONTEXT_TOKEN_BUDGET'] = int(os.getenv('CHAT_CONTEXT_TOKEN_BUDGET', 600))
+app.config['RATE_LIMIT_STORE'] = os.getenv('RATE_LIMIT_STORE', 'memory')  # or a redis:// URL
+app.config['CATEGORIZE_RATE_LIMIT'] = os.getenv('CATEGORIZE_RATE_LIMIT', '30/60')  # requests/seconds
+app.config['CHAT_RATE_LIMIT'] = os.getenv('CHAT_RATE_LIMIT', '10/60')
+app.config['ARCHIVE_HORIZON_DAYS'] = int(os.getenv('ARCHIVE_HORIZON_DAYS', 730))  # used by archive.py
+app.config['AI_BACKEND'] = os.getenv('AI_BACKEND', 'gemini')  # 'fake' injects delays/failures locally
+app.config['AI_MODEL'] = os.getenv('AI_MODEL', 'gemini-1.5-flash')
+app.config['AI_TIMEOUT_SECONDS'] = float(os.getenv('AI_TIMEOUT_SECONDS', 10))
+app.config['AI_DEADLINE_SECONDS'] = float(os.getenv('AI_DEADLINE_SECONDS', 25))
+app.config['AI_MAX_RETRIES'] = int(os.getenv('AI_MAX_RETRIES', 2))
+app.config['AI_BREAKER_FAILURE_RATE'] = float(os.getenv('AI_BREAKER_FAILURE_RATE', 0.5))
+app.config['AI_BREAKER_MIN_CALLS'] = int(os.getenv('AI_BREAKER_MIN_CALLS', 10))
+app.config['AI_BREAKER_COOLDOWN_SECONDS'] = float(os.getenv('AI_BREAKER_COOLDOWN_SECONDS', 30))
+app.config['AI_FAKE_LATENCY'] = float(os.getenv('AI_FAKE_LATENCY', 0))
+app.config['AI_FAKE_FAILURE_RATE'] = float(os.getenv('AI_FAKE_FAILURE_RATE', 0))
 genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
 
 # Initialize extensions
 db.init_app(app)
 jwt = JWTManager(app)
+chat_cache = ChatResponseCache(ttl_seconds=app.config['CHAT_CACHE_TTL_SECONDS'])
+intent_engine = LocalIntentEngine()
+ai_client = create_ai_client(app.config)
+rate_limiter = RateLimiter(create_bucket_store(app.config['RATE_LIMIT_STORE']))
 CORS(app, origins=["http://localhost:3000", "http://localhost:5173", "https://finance-tracker-psql.onrender.com"])
 
 # JWT Error handlers
@@ -43,6 +72,7 @@ with app.app_context():
     try:
         db.create_all()
         print("Database tables created successfully!")
+        setup_search_index(db.engine)
     except Exception as e:
         print(f"Database creation error: {e}")
 
@@ -235,11 +265,52 @@ def create_category():
 def get_expenses():
     try:
         user_id = int(get_jwt_identity())
-        expenses = Expense.query.filter_by(user_id=user_id).order_by(Expense.date.desc()).all()
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        
+        # Without a date range only the hot table is read; archived expenses
+        # are included when an explicit range reaches back into the archive
+        if start_date or end_date:
+            try:
+                start_date = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+                end_date = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+            except ValueError:
+                return jsonify({'error': 'Invalid date format, expected YYYY-MM-DD'}), 400
+            
+            expenses = expenses_in_range(user_id, start_date, end_date)
+        else:
+            expenses = Expense.query.filter_by(user_id=user_id).order_by(Expense.date.desc()).all()
+        
         return jsonify([expense.to_dict() for expense in expenses]), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/expenses/search', methods=['GET'])
+@jwt_required()
+def search_expenses_route():
+    try:
+        user_id = int(get_jwt_identity())
+        query = request.args.get('q', '').strip()
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+        
+        if not query:
+            return jsonify({'error': 'Search query is required'}), 400
+        
+        results, total = search_expenses(user_id, query, page, per_page)
+        
+        return jsonify({
+            'query': query,
+            'results': [{**expense.to_dict(), 'rank': rank} for expense, rank in results],
+            'page': page,
+            'per_page': per_page,
+            'total': total,
+            'pages': (total + per_page - 1) // per_page
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/expenses', methods=['POST'])
 @jwt_required()
 def create_expense():
@@ -261,6 +332,7 @@ def create_expense():
         
         db.session.add(expense)
         db.session.commit()
+        chat_cache.invalidate_user(user_id)
         
         return jsonify({
             'message': 'Expense created successfully',
@@ -271,6 +343,12 @@ def create_expense():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+def expense_not_found(expense_id, user_id):
+    """404 for an unknown expense, or 409 when it was moved to the read-only archive"""
+    if ArchivedExpense.query.filter_by(expense_id=expense_id, user_id=user_id).first():
+        return jsonify({'error': 'Expense is archived and read-only', 'archived': True}), 409
+    return jsonify({'error': 'Expense not found'}), 404
+
 @app.route('/api/expenses/<int:expense_id>', methods=['PUT'])
 @jwt_required()
 def update_expense(expense_id):
@@ -279,7 +357,7 @@ def update_expense(expense_id):
         expense = Expense.query.filter_by(id=expense_id, user_id=user_id).first()
         
         if not expense:
-            return jsonify({'error': 'Expense not found'}), 404
+            return expense_not_found(expense_id, user_id)
         
         data = request.get_json()
         
@@ -295,7 +373,10 @@ def update_expense(expense_id):
         if 'currency' in data:
             expense.currency = data['currency']
         
+        # A stored anomaly describes the old values; the next insights run re-evaluates it
+        ExpenseAnomaly.query.filter_by(expense_id=expense.id).delete()
         db.session.commit()
+        chat_cache.invalidate_user(user_id)
         
         return jsonify({
             'message': 'Expense updated successfully',
@@ -314,10 +395,13 @@ def delete_expense(expense_id):
         expense = Expense.query.filter_by(id=expense_id, user_id=user_id).first()
         
         if not expense:
-            return jsonify({'error': 'Expense not found'}), 404
+            return expense_not_found(expense_id, user_id)
         
+        # Not left to ON DELETE CASCADE, which SQLite doesn't enforce by default
+        ExpenseAnomaly.query.filter_by(expense_id=expense.id).delete()
         db.session.delete(expense)
         db.session.commit()
+        chat_cache.invalidate_user(user_id)
         
         return jsonify({'message': 'Expense deleted successfully'}), 200
         
@@ -347,6 +431,10 @@ def get_dashboard_data():
         
         total_this_month = sum(expense.amount for expense in monthly_expenses)
         
+        # Precomputed by insights_job.py
+        recurring_charges = RecurringCharge.query.filter_by(user_id=user_id).order_by(RecurringCharge.next_expected_date).all()
+        anomalies = ExpenseAnomaly.query.filter_by(user_id=user_id).order_by(ExpenseAnomaly.date.desc()).limit(5).all()
+        
         # Get expenses by category this month
         category_totals = {}
         for expense in monthly_expenses:
@@ -361,7 +449,30 @@ def get_dashboard_data():
             'recent_expenses': [expense.to_dict() for expense in recent_expenses],
             'total_this_month': total_this_month,
             'category_breakdown': category_totals,
-            'expense_count': len(monthly_expenses)
+            'expense_count': len(monthly_expenses),
+            'recurring_charges': [charge.to_dict() for charge in recurring_charges],
+            'anomalies': [anomaly.to_dict() for anomaly in anomalies]
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/insights', methods=['GET'])
+@jwt_required()
+def get_insights():
+    """Recurring charges and unusual expenses stored by the insights batch job"""
+    try:
+        user_id = int(get_jwt_identity())
+        recurring_charges = RecurringCharge.query.filter_by(user_id=user_id).order_by(RecurringCharge.next_expected_date).all()
+        anomalies = ExpenseAnomaly.query.filter_by(user_id=user_id).order_by(ExpenseAnomaly.date.desc()).all()
+        
+        return jsonify({
+            'recurring_charges': [charge.to_dict() for charge in recurring_charges],
+            'monthly_recurring_total': sum(
+                charge.average_amount * {'weekly': 52 / 12, 'biweekly': 26 / 12, 'monthly': 1, 'quarterly': 1 / 3, 'yearly': 1 / 12}[charge.period]
+                for charge in recurring_charges
+            ),
+            'anomalies': [anomaly.to_dict() for anomaly in anomalies]
         }), 200
         
     except Exception as e:
@@ -370,6 +481,7 @@ def get_dashboard_data():
 # ============== AI ASSISTANT ==============
 @app.route('/api/expenses/categorize', methods=['POST'])
 @jwt_required()
+@rate_limiter.limit('categorize', app.config['CATEGORIZE_RATE_LIMIT'])
 def categorize_expense():
     try:
         data = request.get_json()
@@ -392,7 +504,7 @@ def categorize_expense():
         
         # Check if Gemini is configured
         api_key = os.getenv('GEMINI_API_KEY')
-        if not api_key:
+        if not api_key and app.config['AI_BACKEND'] != 'fake':
             print("ERROR: GEMINI_API_KEY not found in environment variables")
             return jsonify({
                 'suggested_category': None,
@@ -403,8 +515,6 @@ def categorize_expense():
         
         # Use Gemini to categorize
         try:
-            # Use the current model name (gemini-pro is deprecated)
-            model = genai.GenerativeModel('gemini-1.5-flash')
             prompt = f"""
             Categorize this expense description: "{description}"
             
@@ -420,8 +530,11 @@ def categorize_expense():
             Response: """
             
             print("Sending request to Gemini...")
-            response = model.generate_content(prompt)
+            response = ai_client.generate(
+                prompt, on_failed_attempt=failed_attempt_recorder(user_id, 'categorize', prompt, estimate_tokens)
+            )
             print(f"Gemini response: {response.text}")
+            record_model_call(user_id, 'categorize', *token_counts(response, prompt, response.text, estimate_tokens))
             
             suggested_category = response.text.strip()
             
@@ -468,8 +581,151 @@ def categorize_expense():
 def test_ai():
     return jsonify({'message': 'AI endpoint working'}), 200
 
+# ============== CHAT HELPERS ==============
+
+def build_financial_context(user, user_id):
+    """Collect the user's spending figures that the chat prompt is built from"""
+    # Get user's expenses and categories
+    expenses = Expense.query.filter_by(user_id=user_id).order_by(Expense.date.desc()).all()
+    categories = Category.query.filter_by(user_id=user_id).all()
+    
+    # Calculate financial insights
+    current_month = datetime.now().month
+    current_year = datetime.now().year
+    
+    # This month's expenses
+    monthly_expenses = [exp for exp in expenses if exp.date.month == current_month and exp.date.year == current_year]
+    total_this_month = sum(exp.amount for exp in monthly_expenses)
+    
+    # Category breakdown this month
+    category_totals = {}
+    for expense in monthly_expenses:
+        if expense.category:
+            cat_name = expense.category.name
+            category_totals[cat_name] = category_totals.get(cat_name, 0) + expense.amount
+    
+    # Recent expenses (last 10)
+    recent_expenses = expenses[:10]
+    
+    # Top spending categories (overall)
+    all_category_totals = {}
+    for expense in expenses:
+        if expense.category:
+            cat_name = expense.category.name
+            all_category_totals[cat_name] = all_category_totals.get(cat_name, 0) + expense.amount
+    
+    # Archived expenses only contribute through their monthly rollups
+    for cat_name, amount in rollup_category_totals(user_id).items():
+        all_category_totals[cat_name] = all_category_totals.get(cat_name, 0) + amount
+    
+    # Total expenses overall
+    total_expenses = sum(all_category_totals.values())
+    
+    # Subscriptions detected by the insights batch job
+    recurring_charges = RecurringCharge.query.filter_by(user_id=user_id).order_by(RecurringCharge.average_amount.desc()).all()
+    
+    return {
+        'total_expenses_all_time': total_expenses,
+        'total_this_month': total_this_month,
+        'monthly_expense_count': len(monthly_expenses),
+        'category_breakdown_this_month': category_totals,
+        'top_categories_overall': dict(sorted(all_category_totals.items(), key=lambda x: x[1], reverse=True)[:5]),
+        'recent_expenses': [
+            {
+                'amount': exp.amount,
+                'description': exp.description,
+                'category': exp.category.name if exp.category else 'Uncategorized',
+                'date': exp.date.strftime('%Y-%m-%d')
+            } for exp in recent_expenses[:5]
+        ],
+        'available_categories': [cat.name for cat in categories],
+        'recurring_charges': [
+            {
+                'description': charge.description,
+                'period': charge.period,
+                'amount': charge.average_amount
+            } for charge in recurring_charges
+        ],
+        'user_name': user.first_name
+    }
+
+def build_chat_prompt(user_message, financial_context):
+    # Context sections in priority order; lower ones are trimmed first for heavy users
+    context_sections = [
+        ('FINANCIAL DATA', [
+            f"- Total expenses (all time): ${financial_context['total_expenses_all_time']:.2f}",
+            f"- Total spent this month: ${financial_context['total_this_month']:.2f}",
+            f"- Number of transactions this month: {financial_context['monthly_expense_count']}"
+        ]),
+        ("THIS MONTH'S SPENDING BY CATEGORY", [
+            f"- {cat}: ${amount:.2f}"
+            for cat, amount in sorted(financial_context['category_breakdown_this_month'].items(), key=lambda x: x[1], reverse=True)
+        ]),
+        ('TOP SPENDING CATEGORIES (OVERALL)', [
+            f"- {cat}: ${amount:.2f}" for cat, amount in financial_context['top_categories_overall'].items()
+        ]),
+        ('RECENT TRANSACTIONS', [
+            f"- ${exp['amount']:.2f} - {exp['description']} ({exp['category']}) on {exp['date']}"
+            for exp in financial_context['recent_expenses']
+        ]),
+        ('AVAILABLE CATEGORIES', [f"- {name}" for name in financial_context['available_categories']]),
+        ('RECURRING CHARGES', [
+            f"- {charge['description']}: ${charge['amount']:.2f} {charge['period']}"
+            for charge in financial_context['recurring_charges']
+        ])
+    ]
+    context_text = apply_token_budget(context_sections, app.config['CHAT_CONTEXT_TOKEN_BUDGET'])
+    
+    return f"""
+You are a helpful personal finance assistant for {financial_context['user_name']}. Answer their question using their actual financial data.
+
+USER QUESTION: "{user_message}"
+
+{context_text}
+
+Instructions:
+1. Use the actual financial data provided above to answer their question
+2. Be conversational and helpful, like a friendly financial advisor
+3. Provide specific numbers and insights from their data
+4. If they ask about spending patterns, give actionable advice
+5. If the question isn't about finances, politely redirect to financial topics
+6. Keep responses concise but informative (2-4 sentences max)
+7. Use a warm, encouraging tone
+8. Lines or sections marked "omitted" were left out for length; if the answer depends on them, say so instead of guessing
+
+Response:"""
+
+def summarize_context(financial_context):
+    """Short summary of the data behind an answer, returned as 'context_used'"""
+    category_breakdown = financial_context['category_breakdown_this_month']
+    return {
+        'total_this_month': financial_context['total_this_month'],
+        'expense_count': financial_context['monthly_expense_count'],
+        'top_category_this_month': max(category_breakdown, key=category_breakdown.get) if category_breakdown else None
+    }
+
+def build_fallback_response(user_message, financial_context):
+    """Keyword-based answer from the user's data, used when Gemini is unavailable"""
+    if 'spend' in user_message.lower() and 'month' in user_message.lower():
+        return f"You've spent ${financial_context['total_this_month']:.2f} this month across {financial_context['monthly_expense_count']} transactions."
+    elif 'category' in user_message.lower() or 'categories' in user_message.lower():
+        if financial_context['category_breakdown_this_month']:
+            top_cat = max(financial_context['category_breakdown_this_month'], key=financial_context['category_breakdown_this_month'].get)
+            return f"Your top spending category this month is {top_cat} with ${financial_context['category_breakdown_this_month'][top_cat]:.2f}."
+        else:
+            return "You haven't recorded any expenses this month yet."
+    elif 'recent' in user_message.lower() or 'latest' in user_message.lower():
+        if financial_context['recent_expenses']:
+            latest = financial_context['recent_expenses'][0]
+            return f"Your most recent expense was ${latest['amount']:.2f} for {latest['description']} in the {latest['category']} category."
+        else:
+            return "You haven't recorded any expenses yet."
+    else:
+        return f"I can help you analyze your spending! You've spent ${financial_context['total_this_month']:.2f} this month. Try asking about your categories, recent transactions, or spending patterns."
+
 @app.route('/api/chat', methods=['POST'])
 @jwt_required()
+@rate_limiter.limit('chat', app.config['CHAT_RATE_LIMIT'])
 def chat_with_ai():
     try:
         data = request.get_json()
@@ -486,107 +742,42 @@ def chat_with_ai():
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        # Get user's expenses and categories
-        expenses = Expense.query.filter_by(user_id=user_id).order_by(Expense.date.desc()).all()
-        categories = Category.query.filter_by(user_id=user_id).all()
+        # Common factual questions are answered from aggregate queries without a model call
+        local_answer = intent_engine.answer(user_id, user_message)
+        if local_answer:
+            print(f"Answered locally as intent '{local_answer['intent']}'")
+            return jsonify({**local_answer, 'answered_locally': True}), 200
         
-        # Calculate financial insights
-        current_month = datetime.now().month
-        current_year = datetime.now().year
-        
-        # This month's expenses
-        monthly_expenses = [exp for exp in expenses if exp.date.month == current_month and exp.date.year == current_year]
-        total_this_month = sum(exp.amount for exp in monthly_expenses)
-        
-        # Category breakdown this month
-        category_totals = {}
-        for expense in monthly_expenses:
-            if expense.category:
-                cat_name = expense.category.name
-                category_totals[cat_name] = category_totals.get(cat_name, 0) + expense.amount
-        
-        # Recent expenses (last 10)
-        recent_expenses = expenses[:10]
-        
-        # Top spending categories (overall)
-        all_category_totals = {}
-        for expense in expenses:
-            if expense.category:
-                cat_name = expense.category.name
-                all_category_totals[cat_name] = all_category_totals.get(cat_name, 0) + expense.amount
-        
-        # Total expenses overall
-        total_expenses = sum(exp.amount for exp in expenses)
+        # Repeat questions against unchanged data are answered from the cache
+        fingerprint = context_fingerprint(user_id)
+        cached = chat_cache.get(user_id, fingerprint, user_message)
+        if cached:
+            print("Chat cache hit")
+            return jsonify({**cached, 'cached': True}), 200
         
         # Prepare context for AI
-        financial_context = {
-            'total_expenses_all_time': total_expenses,
-            'total_this_month': total_this_month,
-            'monthly_expense_count': len(monthly_expenses),
-            'category_breakdown_this_month': category_totals,
-            'top_categories_overall': dict(sorted(all_category_totals.items(), key=lambda x: x[1], reverse=True)[:5]),
-            'recent_expenses': [
-                {
-                    'amount': exp.amount,
-                    'description': exp.description,
-                    'category': exp.category.name if exp.category else 'Uncategorized',
-                    'date': exp.date.strftime('%Y-%m-%d')
-                } for exp in recent_expenses[:5]
-            ],
-            'available_categories': [cat.name for cat in categories],
-            'user_name': user.first_name
-        }
+        financial_context = build_financial_context(user, user_id)
         
         # Generate AI response
         try:
-            model = genai.GenerativeModel('gemini-1.5-flash')
-            
-            prompt = f"""
-You are a helpful personal finance assistant for {financial_context['user_name']}. Answer their question using their actual financial data.
-
-USER QUESTION: "{user_message}"
-
-FINANCIAL DATA:
-- Total expenses (all time): ${financial_context['total_expenses_all_time']:.2f}
-- Total spent this month: ${financial_context['total_this_month']:.2f}
-- Number of transactions this month: {financial_context['monthly_expense_count']}
-
-THIS MONTH'S SPENDING BY CATEGORY:
-{chr(10).join([f"- {cat}: ${amount:.2f}" for cat, amount in financial_context['category_breakdown_this_month'].items()])}
-
-TOP SPENDING CATEGORIES (OVERALL):
-{chr(10).join([f"- {cat}: ${amount:.2f}" for cat, amount in financial_context['top_categories_overall'].items()])}
-
-RECENT TRANSACTIONS:
-{chr(10).join([f"- ${exp['amount']:.2f} - {exp['description']} ({exp['category']}) on {exp['date']}" for exp in financial_context['recent_expenses']])}
-
-AVAILABLE CATEGORIES: {', '.join(financial_context['available_categories'])}
-
-Instructions:
-1. Use the actual financial data provided above to answer their question
-2. Be conversational and helpful, like a friendly financial advisor
-3. Provide specific numbers and insights from their data
-4. If they ask about spending patterns, give actionable advice
-5. If the question isn't about finances, politely redirect to financial topics
-6. Keep responses concise but informative (2-4 sentences max)
-7. Use a warm, encouraging tone
-
-Response:"""
+            prompt = build_chat_prompt(user_message, financial_context)
             
             print("Sending chat request to Gemini...")
-            response = model.generate_content(prompt)
+            response = ai_client.generate(
+                prompt, on_failed_attempt=failed_attempt_recorder(user_id, 'chat', prompt, estimate_tokens)
+            )
             ai_response = response.text.strip()
+            record_model_call(user_id, 'chat', *token_counts(response, prompt, ai_response, estimate_tokens))
             
             print(f"AI response: {ai_response}")
             
-            return jsonify({
+            payload = {
                 'response': ai_response,
-                'context_used': {
-                    'total_this_month': financial_context['total_this_month'],
-                    'expense_count': financial_context['monthly_expense_count'],
-                    'top_category_this_month': max(financial_context['category_breakdown_this_month'], key=financial_context['category_breakdown_this_month'].get) if financial_context['category_breakdown_this_month'] else None
-                }
-            }), 200
+                'context_used': summarize_context(financial_context)
+            }
+            chat_cache.set(user_id, fingerprint, user_message, payload)
+            
+            return jsonify(payload), 200
             
         except Exception as ai_error:
             print(f"AI chat error: {ai_error}")
@@ -594,25 +785,8 @@ Response:"""
             traceback.print_exc()
             
             # Fallback response using actual data
-            if 'spend' in user_message.lower() and 'month' in user_message.lower():
-                fallback_response = f"You've spent ${financial_context['total_this_month']:.2f} this month across {financial_context['monthly_expense_count']} transactions."
-            elif 'category' in user_message.lower() or 'categories' in user_message.lower():
-                if financial_context['category_breakdown_this_month']:
-                    top_cat = max(financial_context['category_breakdown_this_month'], key=financial_context['category_breakdown_this_month'].get)
-                    fallback_response = f"Your top spending category this month is {top_cat} with ${financial_context['category_breakdown_this_month'][top_cat]:.2f}."
-                else:
-                    fallback_response = "You haven't recorded any expenses this month yet."
-            elif 'recent' in user_message.lower() or 'latest' in user_message.lower():
-                if financial_context['recent_expenses']:
-                    latest = financial_context['recent_expenses'][0]
-                    fallback_response = f"Your most recent expense was ${latest['amount']:.2f} for {latest['description']} in the {latest['category']} category."
-                else:
-                    fallback_response = "You haven't recorded any expenses yet."
-            else:
-                fallback_response = f"I can help you analyze your spending! You've spent ${financial_context['total_this_month']:.2f} this month. Try asking about your categories, recent transactions, or spending patterns."
-            
             return jsonify({
-                'response': fallback_response,
+                'response': build_fallback_response(user_message, financial_context),
                 'ai_available': False
             }), 200
         
@@ -622,6 +796,142 @@ Response:"""
         traceback.print_exc()
         return jsonify({'error': 'Failed to process chat message'}), 500
 
+@app.route('/api/chat/stream', methods=['POST'])
+@jwt_required()
+@rate_limiter.limit('chat', app.config['CHAT_RATE_LIMIT'])
+def chat_with_ai_stream():
+    """
+    Streaming variant of /api/chat. Responds with newline-delimited JSON:
+      {"type": "intent", "intent": "...", "slots": {...}}   when answered locally, followed by one token
+      {"type": "context", "context_used": {...}}   sent as soon as the data is loaded
+      {"type": "token", "text": "..."}             one per model chunk
+      {"type": "fallback", "response": "...", "ai_available": false}
+      {"type": "done"}
+    """
+    try:
+        data = request.get_json()
+        user_message = data.get('message', '').strip()
+        user_id = int(get_jwt_identity())
+        
+        print(f"Streaming chat request from user {user_id}: {user_message}")
+        
+        if not user_message:
+            return jsonify({'error': 'Message is required'}), 400
+        
+        user = User.query.get(user_id)
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        local_answer = intent_engine.answer(user_id, user_message)
+        if local_answer:
+            print(f"Answered locally as intent '{local_answer['intent']}'")
+            cached = None
+            financial_context = None
+        else:
+            fingerprint = context_fingerprint(user_id)
+            cached = chat_cache.get(user_id, fingerprint, user_message)
+            financial_context = None if cached else build_financial_context(user, user_id)
+        
+    except Exception as e:
+        print(f"Chat stream endpoint error: {e}")
+        traceback.print_exc()
+        return jsonify({'error': 'Failed to process chat message'}), 500
+    
+    def generate():
+        if local_answer:
+            yield json.dumps({'type': 'intent', 'intent': local_answer['intent'], 'slots': local_answer['slots']}) + '\n'
+            yield json.dumps({'type': 'token', 'text': local_answer['response']}) + '\n'
+            yield json.dumps({'type': 'done'}) + '\n'
+            return
+        
+        if cached:
+            print("Chat cache hit")
+            yield json.dumps({'type': 'context', 'context_used': cached['context_used'], 'cached': True}) + '\n'
+            yield json.dumps({'type': 'token', 'text': cached['response']}) + '\n'
+            yield json.dumps({'type': 'done'}) + '\n'
+            return
+        
+        context_used = summarize_context(financial_context)
+        yield json.dumps({'type': 'context', 'context_used': context_used}) + '\n'
+        
+        try:
+            prompt = build_chat_prompt(user_message, financial_context)
+            
+            print("Sending streaming chat request to Gemini...")
+            chunks = []
+            response = ai_client.stream(
+                prompt, on_failed_attempt=failed_attempt_recorder(user_id, 'chat', prompt, estimate_tokens)
+            )
+            for chunk in response:
+                if chunk.text:
+                    chunks.append(chunk.text)
+                    yield json.dumps({'type': 'token', 'text': chunk.text}) + '\n'
+            
+            record_model_call(user_id, 'chat', *token_counts(response, prompt, ''.join(chunks), estimate_tokens))
+            
+            # Only complete model answers are cached, never fallbacks
+            chat_cache.set(user_id, fingerprint, user_message, {
+                'response': ''.join(chunks).strip(),
+                'context_used': context_used
+            })
+            
+        except Exception as ai_error:
+            # The model may fail before or after some tokens were sent; either way
+            # the client gets a complete answer built from the data alone
+            print(f"AI chat stream error: {ai_error}")
+            traceback.print_exc()
+            
+            yield json.dumps({
+                'type': 'fallback',
+                'response': build_fallback_response(user_message, financial_context),
+                'ai_available': False
+            }) + '\n'
+        
+        yield json.dumps({'type': 'done'}) + '\n'
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    ), 200
+
+@app.route('/api/chat/intents/stats', methods=['GET'])
+@jwt_required()
+def chat_intent_stats():
+    """Per-intent hit rates of the local intent engine since process start"""
+    try:
+        return jsonify(intent_engine.stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/usage', methods=['GET'])
+@jwt_required()
+def get_ai_usage():
+    """The current user's daily Gemini calls and tokens per route over the last ?days= days"""
+    try:
+        user_id = int(get_jwt_identity())
+        days = min(max(request.args.get('days', 30, type=int), 1), 365)
+        end_date = datetime.now(timezone.utc).date()
+        start_date = end_date - timedelta(days=days - 1)
+        
+        return jsonify({
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'usage': usage_summary(start_date, end_date, user_id=user_id)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/ai/metrics', methods=['GET'])
+@jwt_required()
+def get_ai_metrics():
+    """Latency/error counters and circuit breaker state of the shared Gemini client"""
+    return jsonify({
+        **ai_client.metrics.snapshot(),
+        'circuit_state': ai_client.breaker.state
+    }), 200
+
 @app.route('/api/chat/debug', methods=['GET'])
 def debug_chat():
     return jsonify({'message': 'Chat endpoint exists and is reachable'}), 200
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Moves expenses older than the retention horizon from the hot expense table into
+archived_expense and keeps per-category monthly rollups of what was moved.
+Run this from the backend directory: python archive.py [--horizon-days N]
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+from sqlalchemy import func
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models import db, Category, Expense, ArchivedExpense, MonthlyRollup, ExpenseAnomaly
+
+
+def archive_cutoff(horizon_days, today=None):
+    """Expenses dated before this day belong in the archive"""
+    return (today or date.today()) - timedelta(days=horizon_days)
+
+
+def _add_to_rollups(expenses):
+    totals = defaultdict(lambda: [0.0, 0])
+    for expense in expenses:
+        key = (expense.user_id, expense.category_id, expense.date.year, expense.date.month)
+        totals[key][0] += expense.amount
+        totals[key][1] += 1
+
+    for (user_id, category_id, year, month), (amount, count) in totals.items():
+        rollup = MonthlyRollup.query.filter_by(
+            user_id=user_id, category_id=category_id, year=year, month=month
+        ).first()
+        if not rollup:
+            rollup = MonthlyRollup(user_id=user_id, category_id=category_id, year=year, month=month,
+                                   total_amount=0, expense_count=0)
+            db.session.add(rollup)
+        rollup.total_amount += amount
+        rollup.expense_count += count
+
+
+def archive_expenses(cutoff, batch_size=1000):
+    """
+    Move every expense dated before cutoff in batches, one transaction per batch,
+    so a failure never leaves a row in both tables or in neither. Returns the count.
+    """
+    moved = 0
+
+    while True:
+        batch = Expense.query.filter(Expense.date < cutoff).order_by(Expense.id).limit(batch_size).all()
+        if not batch:
+            return moved
+
+        try:
+            ids = [expense.id for expense in batch]
+            for expense in batch:
+                db.session.add(ArchivedExpense(
+                    expense_id=expense.id,
+                    amount=expense.amount,
+                    description=expense.description,
+                    date=expense.date,
+                    currency=expense.currency,
+                    user_id=expense.user_id,
+                    category_id=expense.category_id,
+                    created_at=expense.created_at
+                ))
+            _add_to_rollups(batch)
+
+            ExpenseAnomaly.query.filter(ExpenseAnomaly.expense_id.in_(ids)).delete(synchronize_session=False)
+            Expense.query.filter(Expense.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        db.session.expunge_all()
+        moved += len(batch)
+        print(f"Archived {moved} expenses so far...")
+
+
+# ============== READ HELPERS ==============
+
+def archive_boundary(user_id):
+    """Latest archived expense date for a user (None if nothing is archived); one index lookup"""
+    return db.session.query(func.max(ArchivedExpense.date)).filter(ArchivedExpense.user_id == user_id).scalar()
+
+
+def range_reaches_archive(user_id, start_date):
+    """True when a query starting at start_date (None = all time) needs archived rows"""
+    boundary = archive_boundary(user_id)
+    return boundary is not None and (start_date is None or start_date <= boundary)
+
+
+def expenses_in_range(user_id, start_date=None, end_date=None):
+    """
+    Expenses in an inclusive date range, newest first. Only ranges that reach back past
+    the archive boundary also read archived_expense; everything else hits the hot table.
+    """
+    filters = [Expense.user_id == user_id]
+    if start_date:
+        filters.append(Expense.date >= start_date)
+    if end_date:
+        filters.append(Expense.date <= end_date)
+    expenses = Expense.query.filter(*filters).all()
+
+    if range_reaches_archive(user_id, start_date):
+        archived_filters = [ArchivedExpense.user_id == user_id]
+        if start_date:
+            archived_filters.append(ArchivedExpense.date >= start_date)
+        if end_date:
+            archived_filters.append(ArchivedExpense.date <= end_date)
+        expenses += ArchivedExpense.query.filter(*archived_filters).all()
+
+    return sorted(expenses, key=lambda expense: expense.date, reverse=True)
+
+
+def archived_aggregate(user_id, start_date=None, end_date=None, category_id=None):
+    """(total, count) of archived expenses in a range, or (0.0, 0) if the range is all hot"""
+    if not range_reaches_archive(user_id, start_date):
+        return 0.0, 0
+
+    filters = [ArchivedExpense.user_id == user_id]
+    if start_date:
+        filters.append(ArchivedExpense.date >= start_date)
+    if end_date:
+        filters.append(ArchivedExpense.date <= end_date)
+    if category_id is not None:
+        filters.append(ArchivedExpense.category_id == category_id)
+
+    total, count = db.session.query(
+        func.coalesce(func.sum(ArchivedExpense.amount), 0),
+        func.count(ArchivedExpense.id)
+    ).filter(*filters).one()
+    return float(total), count
+
+
+def archived_category_totals(user_id, start_date=None, end_date=None):
+    """{category name: archived total} for a range, or {} if the range is all hot"""
+    if not range_reaches_archive(user_id, start_date):
+        return {}
+
+    filters = [ArchivedExpense.user_id == user_id]
+    if start_date:
+        filters.append(ArchivedExpense.date >= start_date)
+    if end_date:
+        filters.append(ArchivedExpense.date <= end_date)
+
+    rows = db.session.query(Category.name, func.sum(ArchivedExpense.amount)).join(
+        Category, ArchivedExpense.category_id == Category.id
+    ).filter(*filters).group_by(Category.name).all()
+    return {name: float(total) for name, total in rows}
+
+
+def rollup_category_totals(user_id):
+    """All-time {category name: archived total} from the compact monthly rollups"""
+    rows = db.session.query(Category.name, func.sum(MonthlyRollup.total_amount)).join(
+        Category, MonthlyRollup.category_id == Category.id
+    ).filter(MonthlyRollup.user_id == user_id).group_by(Category.name).all()
+    return {name: float(total) for name, total in rows}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive expenses older than the retention horizon")
+    parser.add_argument('--horizon-days', type=int, default=None,
+                        help="keep this many days in the hot table (default: ARCHIVE_HORIZON_DAYS)")
+    parser.add_argument('--batch-size', type=int, default=1000, help="expenses moved per transaction")
+    args = parser.parse_args()
+
+    from app import app
+
+    with app.app_context():
+        horizon_days = args.horizon_days or app.config['ARCHIVE_HORIZON_DAYS']
+        cutoff = archive_cutoff(horizon_days)
+        print(f"Archiving expenses dated before {cutoff} ({horizon_days} day horizon)...")
+
+        started = time.perf_counter()
+        moved = archive_expenses(cutoff, args.batch_size)
+        print(f"Archived {moved} expenses in {time.perf_counter() - started:.1f}s")
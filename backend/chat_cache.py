@@ -0,0 +1,130 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import func
+
+from models import db, Category, Expense, RecurringCharge
+
+
+def normalize_question(message):
+    """Lowercase, strip punctuation and collapse whitespace so trivial rewordings share a key"""
+    message = re.sub(r"[^\w\s$]", " ", message.lower())
+    return " ".join(message.split())
+
+
+def context_fingerprint(user_id):
+    """
+    Cheap fingerprint of the data a chat answer depends on. One aggregate query
+    instead of loading every expense, so a cache lookup stays fast for heavy users.
+    The current month is included because "this month" answers roll over, and the
+    recurring charges because insights_job.py rewrites them outside expense writes.
+    """
+    count, max_id, total, last_created = db.session.query(
+        func.count(Expense.id),
+        func.max(Expense.id),
+        func.sum(Expense.amount),
+        func.max(Expense.created_at)
+    ).filter(Expense.user_id == user_id).one()
+    category_count = Category.query.filter_by(user_id=user_id).count()
+    recurring_count, recurring_computed = db.session.query(
+        func.count(RecurringCharge.id),
+        func.max(RecurringCharge.computed_at)
+    ).filter(RecurringCharge.user_id == user_id).one()
+
+    raw = (f"{user_id}|{count}|{max_id}|{total}|{last_created}|{category_count}|"
+           f"{recurring_count}|{recurring_computed}|{datetime.now():%Y-%m}")
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+class ChatResponseCache:
+    """
+    In-process LRU cache of chat answers keyed by (user, fingerprint, normalized question).
+    Entries expire after ttl_seconds and are dropped for a user on any expense write.
+    """
+
+    def __init__(self, max_entries=1000, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, user_id, fingerprint, message):
+        return (user_id, fingerprint, normalize_question(message))
+
+    def get(self, user_id, fingerprint, message):
+        key = self._key(user_id, fingerprint, message)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, user_id, fingerprint, message, payload):
+        key = self._key(user_id, fingerprint, message)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+# ============== PROMPT BUDGETING ==============
+
+def estimate_tokens(text):
+    """Rough token estimate (~4 characters per token for English text)"""
+    return (len(text) + 3) // 4
+
+
+def apply_token_budget(sections, max_tokens):
+    """
+    Trim prompt context sections so their combined size stays within max_tokens.
+
+    sections is a list of (title, lines) in priority order. Each section keeps its
+    title and as many leading lines as fit; once the budget runs out, the remaining
+    sections are replaced by one "(N more sections omitted)" line so the model knows
+    data is missing. Returns the rendered text.
+    """
+    remaining = max_tokens
+    rendered = []
+
+    for position, (title, lines) in enumerate(sections):
+        header = f"{title}:"
+        cost = estimate_tokens(header)
+        if cost > remaining:
+            omitted = len(sections) - position
+            rendered.append(f"({omitted} more section{'s' if omitted > 1 else ''} omitted)")
+            break
+        remaining -= cost
+        kept = [header]
+
+        for index, line in enumerate(lines):
+            line_cost = estimate_tokens(line) + 1
+            if line_cost > remaining:
+                kept.append(f"- ... ({len(lines) - index} more omitted)")
+                remaining = 0
+                break
+            kept.append(line)
+            remaining -= line_cost
+
+        rendered.append("\n".join(kept))
+
+    return "\n\n".join(rendered)
@@ -0,0 +1,404 @@
+import calendar
+import re
+import threading
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import func
+
+from archive import archived_aggregate, archived_category_totals, range_reaches_archive
+from models import db, Category, Expense, ArchivedExpense
+
+
+# Questions asking for advice or interpretation always go to the model
+OPEN_ENDED_PATTERN = re.compile(
+    r"\b(why|should|advice|advise|tips?|recommend\w*|suggest\w*|how (can|do|could|should) i|help me|"
+    r"sav(e|ing|ings)|budget\w*|plan\w*|compare|comparison|trends?|patterns?|improve|reduce|cut|afford)\b"
+)
+
+# Comparisons, remaining balances, per-day/when questions and periods or filters the
+# slots can't express need more than one aggregate, so they go to the model rather
+# than getting a half answer
+UNSUPPORTED_PATTERN = re.compile(
+    r"\b(than|vs|versus|more|less|compared|left|remaining|which day|when|daily|weekly|monthly)\b|"
+    r"\b(per|a|each) (day|week|month|year)\b|\b(on|at|for)\s*\??\s*$|"
+    r"\b(weeks|months|years|quarters?|weekends?|since|between|over|until|before|after|from)\b|"
+    r"\b(19|20)\d{2}\b"
+)
+
+# Period phrases extract_date_range understands; a question may name at most one
+PERIOD_PATTERN = re.compile(
+    r"\b((last|past)\s+\d{1,3}\s+days?|(this|last)\s+(week|month|year)|today|yesterday|"
+    r"january|february|march|april|june|july|august|september|october|november|december|(in|during|for)\s+may)\b"
+)
+
+# Words a question may contain besides its period and category without changing
+# what is asked: question words, pronouns, prepositions and the intent keywords
+FILLER_WORDS = {
+    'what', 'whats', 'how', 'much', 'many', 'where', 'did', 'do', 'does', 'have', 'has', 'had', 'is', 'was',
+    'are', 'were', 'been', 'can', 'you', 'please', 'show', 'tell', 'give', 'list', 'see', 'i', 'me', 'my',
+    's', 've', 'm', 'd', 'the', 'a', 'an', 'and', 'in', 'on', 'at', 'for', 'of', 'to', 'by', 'so', 'far', 'yet',
+    'all', 'time', 'ever', 'overall', 'total', 'totals', 'spend', 'spent', 'spending', 'cost', 'money',
+    'expense', 'expenses', 'transaction', 'transactions', 'purchase', 'purchases', 'payment', 'payments',
+    'recent', 'latest', 'last', 'few', 'top', 'biggest', 'largest', 'most', 'highest', 'main', 'expensive',
+    'category', 'categories', 'breakdown', 'break', 'down', 'per', 'each', 'number', 'count', 'average',
+    'avg', 'typical'
+}
+
+# Checked in order; the first match wins
+INTENT_PATTERNS = [
+    ('recent_expenses', re.compile(r"\b(recent|latest|last (few )?(transactions?|expenses?|purchases?))\b")),
+    ('top_category', re.compile(
+        r"\b(top|biggest|largest|most|highest|main)\b.*\bcategor|\bcategor\w*\b.*\b(most|top|biggest)\b|\bwhere\b.*\bmost\b"
+    )),
+    ('largest_expense', re.compile(
+        r"\b(biggest|largest|most expensive|highest)\b.*\b(expense|purchase|transaction|payment)s?\b"
+    )),
+    ('category_breakdown', re.compile(r"\b(breakdown|break down|by category|per category|each category|categories)\b")),
+    ('expense_count', re.compile(r"\b(how many|number of|count)\b")),
+    ('average_expense', re.compile(r"\b(average|avg|typical)\b")),
+    ('total_spent', re.compile(r"\b(how much|total|spent|spend|spending|cost)\b")),
+]
+
+MONTH_NAMES = {name.lower(): index for index, name in enumerate(calendar.month_name) if name}
+
+# Words too generic to identify a category on their own
+CATEGORY_STOPWORDS = {'other', 'and', 'the'}
+
+
+# ============== SLOT EXTRACTION ==============
+
+def extract_date_range(message, today=None):
+    """
+    Find the period a question refers to. Returns (start, end, label) with inclusive
+    dates, (None, None, label) for all time, or None when no period is mentioned.
+    """
+    today = today or date.today()
+
+    if re.search(r"\btoday\b", message):
+        return today, today, 'today'
+    if re.search(r"\byesterday\b", message):
+        yesterday = today - timedelta(days=1)
+        return yesterday, yesterday, 'yesterday'
+
+    match = re.search(r"\b(?:last|past)\s+(\d{1,3})\s+days?\b", message)
+    if match and int(match.group(1)) >= 1:
+        days = int(match.group(1))
+        return today - timedelta(days=days - 1), today, f'in the last {days} days'
+
+    week_start = today - timedelta(days=today.weekday())
+    if re.search(r"\bthis week\b", message):
+        return week_start, today, 'this week'
+    if re.search(r"\blast week\b", message):
+        return week_start - timedelta(days=7), week_start - timedelta(days=1), 'last week'
+
+    month_start = today.replace(day=1)
+    if re.search(r"\bthis month\b", message):
+        return month_start, today, 'this month'
+    if re.search(r"\blast month\b", message):
+        last_month_end = month_start - timedelta(days=1)
+        return last_month_end.replace(day=1), last_month_end, 'last month'
+
+    if re.search(r"\bthis year\b", message):
+        return today.replace(month=1, day=1), today, 'this year'
+    if re.search(r"\blast year\b", message):
+        return date(today.year - 1, 1, 1), date(today.year - 1, 12, 31), 'last year'
+
+    # "may" is only treated as a month after a preposition ("in may"), not in "may I..."
+    match = re.search(
+        r"\b(january|february|march|april|june|july|august|september|october|november|december)\b|\b(?:in|during|for)\s+(may)\b",
+        message
+    )
+    if match:
+        month = MONTH_NAMES[match.group(1) or match.group(2)]
+        year = today.year if month <= today.month else today.year - 1
+        last_day = calendar.monthrange(year, month)[1]
+        return date(year, month, 1), date(year, month, last_day), f'in {calendar.month_name[month]} {year}'
+
+    # Checked last so "so far this month" keeps its explicit period
+    if re.search(r"\b(all time|ever|overall|in total|so far)\b", message):
+        return None, None, 'in total'
+
+    return None
+
+
+def _category_words(category):
+    return [word for word in re.findall(r"[a-z]+", category.name.lower())
+            if len(word) >= 4 and word not in CATEGORY_STOPWORDS]
+
+
+def _matches_word(token, words):
+    return len(token) >= 4 and any(word.startswith(token) or token.startswith(word) for word in words)
+
+
+def extract_category(message, categories):
+    """Match a user category by full name first, then by a distinctive word ("food" -> "Food & Dining")"""
+    for category in categories:
+        if category.name.lower() in message:
+            return category
+
+    tokens = re.findall(r"[a-z]+", message)
+    for category in categories:
+        words = _category_words(category)
+        if any(_matches_word(token, words) for token in tokens):
+            return category
+
+    return None
+
+
+def uncovered_words(message, category=None):
+    """
+    Words of a question that neither the period, the category nor a filler word
+    accounts for ("rent", "amazon", "15"). The aggregates would silently ignore them.
+    """
+    message = PERIOD_PATTERN.sub(" ", message)
+    words = []
+    if category is not None:
+        message = message.replace(category.name.lower(), " ")
+        words = _category_words(category)
+
+    return [token for token in re.findall(r"[a-z0-9]+", message)
+            if token not in FILLER_WORDS and not _matches_word(token, words)]
+
+
+def classify(message, categories, today=None):
+    """
+    Map a chat message to (intent, slots), or None when the question is open-ended
+    or mentions something the slots can't capture and should be answered by the model.
+    """
+    message = message.lower()
+
+    if OPEN_ENDED_PATTERN.search(message) or UNSUPPORTED_PATTERN.search(message):
+        return None
+
+    # "last 0 days" is not a period we can answer for
+    match = re.search(r"\b(?:last|past)\s+(\d{1,3})\s+days?\b", message)
+    if match and int(match.group(1)) < 1:
+        return None
+
+    intent = next((name for name, pattern in INTENT_PATTERNS if pattern.search(message)), None)
+    if intent is None:
+        return None
+
+    # Only answer when the slots cover the whole question
+    category = extract_category(message, categories)
+    if len(PERIOD_PATTERN.findall(message)) > 1 or uncovered_words(message, category):
+        return None
+
+    # "How much on food by category" is really a single-category total
+    if intent == 'category_breakdown' and category:
+        intent = 'total_spent'
+
+    slots = {
+        'date_range': extract_date_range(message, today),
+        'category': category
+    }
+    return intent, slots
+
+
+# ============== AGGREGATE QUERIES ==============
+
+def _filters(user_id, date_range, category=None):
+    filters = [Expense.user_id == user_id]
+    if date_range and date_range[0] is not None:
+        filters.append(Expense.date.between(date_range[0], date_range[1]))
+    if category is not None:
+        filters.append(Expense.category_id == category.id)
+    return filters
+
+
+def _date_bounds(date_range):
+    return (date_range[0], date_range[1]) if date_range else (None, None)
+
+
+def _total_and_count(user_id, date_range, category=None):
+    total, count = db.session.query(
+        func.coalesce(func.sum(Expense.amount), 0),
+        func.count(Expense.id)
+    ).filter(*_filters(user_id, date_range, category)).one()
+
+    # Ranges reaching past the archive boundary also count archived expenses
+    archived_total, archived_count = archived_aggregate(
+        user_id, *_date_bounds(date_range), category_id=category.id if category else None
+    )
+    return float(total) + archived_total, count + archived_count
+
+
+def _category_totals(user_id, date_range):
+    totals = dict(db.session.query(Category.name, func.sum(Expense.amount)).join(
+        Category, Expense.category_id == Category.id
+    ).filter(*_filters(user_id, date_range)).group_by(Category.name).all())
+
+    for name, amount in archived_category_totals(user_id, *_date_bounds(date_range)).items():
+        totals[name] = totals.get(name, 0) + amount
+    return sorted(totals.items(), key=lambda x: x[1], reverse=True)
+
+
+# ============== INTENT HANDLERS ==============
+
+def _scope(slots):
+    label = slots['date_range'][2]
+    if slots['category']:
+        return f"on {slots['category'].name} {label}"
+    return label
+
+
+def answer_total_spent(user_id, slots):
+    total, count = _total_and_count(user_id, slots['date_range'], slots['category'])
+    if count == 0:
+        return f"You haven't recorded any expenses {_scope(slots)}."
+    return f"You've spent ${total:.2f} {_scope(slots)} across {count} transactions."
+
+
+def answer_expense_count(user_id, slots):
+    _, count = _total_and_count(user_id, slots['date_range'], slots['category'])
+    return f"You've recorded {count} transactions {_scope(slots)}."
+
+
+def answer_average_expense(user_id, slots):
+    total, count = _total_and_count(user_id, slots['date_range'], slots['category'])
+    if count == 0:
+        return f"You haven't recorded any expenses {_scope(slots)}."
+    return f"Your average expense {_scope(slots)} is ${total / count:.2f} over {count} transactions."
+
+
+def answer_top_category(user_id, slots):
+    totals = _category_totals(user_id, slots['date_range'])
+    label = slots['date_range'][2]
+    if not totals:
+        return f"You haven't recorded any expenses {label}."
+    name, amount = totals[0]
+    return f"Your top spending category {label} is {name} with ${amount:.2f}."
+
+
+def answer_category_breakdown(user_id, slots):
+    totals = _category_totals(user_id, slots['date_range'])
+    label = slots['date_range'][2]
+    if not totals:
+        return f"You haven't recorded any expenses {label}."
+    lines = ', '.join(f"{name} ${amount:.2f}" for name, amount in totals)
+    return f"Here's your spending by category {label}: {lines}."
+
+
+def answer_largest_expense(user_id, slots):
+    expense = Expense.query.filter(*_filters(user_id, slots['date_range'], slots['category'])).order_by(
+        Expense.amount.desc()
+    ).first()
+
+    start, end = _date_bounds(slots['date_range'])
+    if range_reaches_archive(user_id, start):
+        archived_filters = [ArchivedExpense.user_id == user_id]
+        if start is not None:
+            archived_filters.append(ArchivedExpense.date.between(start, end))
+        if slots['category'] is not None:
+            archived_filters.append(ArchivedExpense.category_id == slots['category'].id)
+        archived = ArchivedExpense.query.filter(*archived_filters).order_by(ArchivedExpense.amount.desc()).first()
+        if archived and (not expense or archived.amount > expense.amount):
+            expense = archived
+
+    if not expense:
+        return f"You haven't recorded any expenses {_scope(slots)}."
+    return (f"Your largest expense {_scope(slots)} was ${expense.amount:.2f} for {expense.description} "
+            f"on {expense.date.strftime('%Y-%m-%d')}.")
+
+
+def answer_recent_expenses(user_id, slots):
+    expenses = Expense.query.filter(*_filters(user_id, slots['date_range'], slots['category'])).order_by(
+        Expense.date.desc(), Expense.id.desc()
+    ).limit(3).all()
+    if not expenses:
+        return "You haven't recorded any expenses yet."
+    latest = expenses[0]
+    response = (f"Your most recent expense was ${latest.amount:.2f} for {latest.description} "
+                f"in the {latest.category.name if latest.category else 'Uncategorized'} category.")
+    if len(expenses) > 1:
+        earlier = '; '.join(f"${exp.amount:.2f} for {exp.description} on {exp.date.strftime('%Y-%m-%d')}"
+                            for exp in expenses[1:])
+        response += f" Before that: {earlier}."
+    return response
+
+
+INTENT_HANDLERS = {
+    'total_spent': answer_total_spent,
+    'expense_count': answer_expense_count,
+    'average_expense': answer_average_expense,
+    'top_category': answer_top_category,
+    'category_breakdown': answer_category_breakdown,
+    'largest_expense': answer_largest_expense,
+    'recent_expenses': answer_recent_expenses,
+}
+
+# Intents that describe "all time" when no period is given; the rest default to this month
+ALL_TIME_BY_DEFAULT = {'recent_expenses'}
+
+
+class LocalIntentEngine:
+    """
+    Answers common factual chat questions straight from aggregate queries and
+    keeps per-intent counters so the share of model traffic it saves is visible.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.total_questions = 0
+        self.escalated = 0
+        self.intent_hits = {name: 0 for name in INTENT_HANDLERS}
+        self.intent_time_ms = {name: 0.0 for name in INTENT_HANDLERS}
+
+    def answer(self, user_id, message, today=None):
+        """Return {'intent', 'slots', 'response'} or None when the model should answer"""
+        started = time.perf_counter()
+        categories = Category.query.filter_by(user_id=user_id).all()
+        classified = classify(message, categories, today)
+
+        if classified is None:
+            with self._lock:
+                self.total_questions += 1
+                self.escalated += 1
+            return None
+
+        intent, slots = classified
+        # classify() escalates any period it can't parse, so no period here really means none
+        if slots['date_range'] is None:
+            if intent in ALL_TIME_BY_DEFAULT:
+                slots['date_range'] = (None, None, 'in total')
+            else:
+                slots['date_range'] = extract_date_range('this month', today)
+
+        response = INTENT_HANDLERS[intent](user_id, slots)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        with self._lock:
+            self.total_questions += 1
+            self.intent_hits[intent] += 1
+            self.intent_time_ms[intent] += elapsed_ms
+
+        start, end, label = slots['date_range']
+        return {
+            'intent': intent,
+            'slots': {
+                'period': label,
+                'start_date': start.isoformat() if start else None,
+                'end_date': end.isoformat() if end else None,
+                'category': slots['category'].name if slots['category'] else None
+            },
+            'response': response
+        }
+
+    def stats(self):
+        with self._lock:
+            total = self.total_questions
+            answered = total - self.escalated
+            return {
+                'total_questions': total,
+                'answered_locally': answered,
+                'escalated_to_model': self.escalated,
+                'local_hit_rate': answered / total if total else 0.0,
+                'intents': {
+                    name: {
+                        'hits': hits,
+                        'hit_rate': hits / total if total else 0.0,
+                        'avg_latency_ms': self.intent_time_ms[name] / hits if hits else 0.0
+                    } for name, hits in self.intent_hits.items()
+                }
+            }
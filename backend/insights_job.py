@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Offline batch job that detects recurring charges and anomalous expenses
+and stores them in the recurring_charge / expense_anomaly tables.
+Run this from the backend directory: python insights_job.py [--workers N]
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+import numpy as np
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Expected gap in days and allowed deviation for each recurrence period
+PERIODS = [
+    ('weekly', 7, 2),
+    ('biweekly', 14, 3),
+    ('monthly', 30.4, 4),
+    ('quarterly', 91, 10),
+    ('yearly', 365, 15),
+]
+
+MIN_OCCURRENCES = 3
+MIN_REGULAR_FRACTION = 0.75
+MAX_AMOUNT_VARIATION = 0.25
+
+MIN_CATEGORY_SAMPLES = 5
+ANOMALY_Z_SCORE = 3.0
+STD_FLOOR_RATIO = 0.1
+
+
+def normalize_description(description):
+    """Collapse descriptions like "NETFLIX.COM 8472" and "Netflix #123" to a shared key"""
+    description = description.lower()
+    description = re.sub(r"\d+", " ", description)
+    description = re.sub(r"[^a-z\s]", " ", description)
+    description = re.sub(r"\b(com|www|inc|llc|ltd|payment|purchase|pos|debit)\b", " ", description)
+    return " ".join(description.split())
+
+
+def stream_expenses(user_id, chunk_size):
+    """Yield a user's expenses in chunks of plain tuples instead of loading ORM objects at once"""
+    from models import db, Expense
+
+    query = db.session.query(
+        Expense.id, Expense.date, Expense.amount, Expense.category_id, Expense.description
+    ).filter(Expense.user_id == user_id).order_by(Expense.date, Expense.id).execution_options(
+        yield_per=chunk_size
+    )
+
+    chunk = []
+    for row in query:
+        chunk.append(tuple(row))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def add_to_groups(groups, chunk):
+    """
+    Fold a chunk into per-description groups. Only the date ordinal and amount of
+    each charge are kept, plus the latest description/category of the group.
+    """
+    for _, expense_date, amount, category_id, description in chunk:
+        key = normalize_description(description)
+        if not key:
+            continue
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {'ordinals': [], 'amounts': []}
+        group['ordinals'].append(expense_date.toordinal())
+        group['amounts'].append(amount)
+        # Rows arrive in date order, so the last one seen is the latest charge
+        group['last_date'] = expense_date
+        group['description'] = description
+        group['category_id'] = category_id
+
+
+def detect_recurring(groups, today=None):
+    """
+    Find description groups whose charges repeat at a regular period with a stable amount.
+    Groups whose next charge is overdue by more than the period's tolerance are treated
+    as cancelled and skipped, so old subscriptions don't count as current spending.
+    """
+    today = today or date.today()
+    recurring = []
+
+    for key, group in groups.items():
+        if len(group['ordinals']) < MIN_OCCURRENCES:
+            continue
+
+        ordinals = np.array(group['ordinals'])
+        amounts = np.array(group['amounts'], dtype=float)
+        gaps = np.diff(ordinals)
+        gaps = gaps[gaps > 0]  # same-day duplicates don't tell us anything about the period
+        if len(gaps) < MIN_OCCURRENCES - 1:
+            continue
+
+        median_gap = float(np.median(gaps))
+        period = next((p for p in PERIODS if abs(median_gap - p[1]) <= p[2]), None)
+        if period is None:
+            continue
+
+        name, expected_gap, tolerance = period
+        next_expected_date = group['last_date'] + timedelta(days=round(expected_gap))
+        if next_expected_date + timedelta(days=tolerance) < today:
+            continue
+
+        regular_fraction = float(np.mean(np.abs(gaps - expected_gap) <= tolerance))
+        mean_amount = float(amounts.mean())
+        variation = float(amounts.std() / mean_amount) if mean_amount > 0 else 1.0
+        if regular_fraction < MIN_REGULAR_FRACTION or variation > MAX_AMOUNT_VARIATION:
+            continue
+
+        recurring.append({
+            'description_key': key,
+            'description': group['description'],
+            'category_id': group['category_id'],
+            'period': name,
+            'average_amount': round(mean_amount, 2),
+            'occurrences': len(amounts),
+            'last_date': group['last_date'],
+            'next_expected_date': next_expected_date,
+            'confidence': round(regular_fraction * (1 - variation), 3)
+        })
+
+    return recurring
+
+
+def _chunk_arrays(chunk):
+    ids, dates, amounts, category_ids, descriptions = zip(*chunk)
+    return np.array(ids), dates, np.array(amounts, dtype=float), np.array(category_ids), descriptions
+
+
+def add_category_stats(stats, chunk):
+    """Running per-category count, sum and sum of squares, updated one chunk at a time"""
+    _, _, amounts, category_ids, _ = _chunk_arrays(chunk)
+    categories, category_index = np.unique(category_ids, return_inverse=True)
+    counts = np.bincount(category_index)
+    sums = np.bincount(category_index, weights=amounts)
+    squares = np.bincount(category_index, weights=amounts ** 2)
+
+    for i, category_id in enumerate(categories):
+        entry = stats[int(category_id)]
+        entry[0] += counts[i]
+        entry[1] += sums[i]
+        entry[2] += squares[i]
+
+
+def detect_anomalies(chunk, stats):
+    """
+    Flag amounts in a chunk that are far above the rest of their category, all rows at once.
+    Each row is compared with its category's mean/std excluding that row (from the
+    running stats), so a single large outlier can't inflate the statistics it is judged against.
+    """
+    ids, dates, amounts, category_ids, descriptions = _chunk_arrays(chunk)
+    counts = np.array([stats[int(c)][0] for c in category_ids], dtype=float)
+    sums = np.array([stats[int(c)][1] for c in category_ids])
+    squares = np.array([stats[int(c)][2] for c in category_ids])
+
+    others = counts - 1
+    eligible = others >= MIN_CATEGORY_SAMPLES
+    safe_others = np.where(eligible, others, 1)
+    means = np.where(eligible, (sums - amounts) / safe_others, 0.0)
+    variances = np.clip((squares - amounts ** 2) / safe_others - means ** 2, 0, None)
+    # Floor the spread so categories with near-constant prices still flag big jumps
+    stds = np.maximum(np.sqrt(variances), STD_FLOOR_RATIO * np.abs(means))
+    eligible &= stds > 0
+
+    z_scores = np.zeros_like(amounts)
+    z_scores[eligible] = (amounts[eligible] - means[eligible]) / stds[eligible]
+
+    return [
+        {
+            'expense_id': int(ids[i]),
+            'category_id': int(category_ids[i]),
+            'amount': float(amounts[i]),
+            'expected_amount': round(float(means[i]), 2),
+            'z_score': round(float(z_scores[i]), 2),
+            'date': dates[i],
+            'description': descriptions[i]
+        }
+        for i in np.flatnonzero(z_scores >= ANOMALY_Z_SCORE)
+    ]
+
+
+def analyze_user(user_id, chunk_size=1000, today=None):
+    """
+    Worker entry point: two streaming passes over one user's history. The first builds
+    per-category stats and description groups, the second scores each chunk for anomalies.
+    """
+    from app import app
+
+    with app.app_context():
+        groups = {}
+        stats = defaultdict(lambda: [0, 0.0, 0.0])
+        expense_count = 0
+
+        for chunk in stream_expenses(user_id, chunk_size):
+            add_to_groups(groups, chunk)
+            add_category_stats(stats, chunk)
+            expense_count += len(chunk)
+
+        anomalies = []
+        for chunk in stream_expenses(user_id, chunk_size):
+            anomalies.extend(detect_anomalies(chunk, stats))
+
+        return {
+            'user_id': user_id,
+            'expense_count': expense_count,
+            'recurring': detect_recurring(groups, today),
+            'anomalies': anomalies
+        }
+
+
+def store_results(result):
+    """
+    Replace a user's stored insights with a fresh result in one transaction. On failure
+    (e.g. an anomaly's expense was deleted since the analysis) the user's previous
+    insights are kept and False is returned, so the caller can move on to the next user.
+    """
+    from models import db, RecurringCharge, ExpenseAnomaly
+
+    user_id = result['user_id']
+    try:
+        RecurringCharge.query.filter_by(user_id=user_id).delete()
+        ExpenseAnomaly.query.filter_by(user_id=user_id).delete()
+
+        for charge in result['recurring']:
+            db.session.add(RecurringCharge(user_id=user_id, **charge))
+        for anomaly in result['anomalies']:
+            db.session.add(ExpenseAnomaly(user_id=user_id, **anomaly))
+
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        print(f"User {user_id}: storing insights failed, kept previous results: {e}")
+        return False
+
+
+def _init_worker():
+    # Forked workers must not reuse the parent's pooled database connections. close=False
+    # drops them from this process's pool without closing the parent's sessions
+    from app import app
+    from models import db
+
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def run(user_ids=None, workers=None, chunk_size=1000):
+    """Analyze users in parallel; workers only read, the parent process writes the results"""
+    from app import app
+    from models import User
+
+    with app.app_context():
+        if user_ids is None:
+            user_ids = [row.id for row in User.query.with_entities(User.id).all()]
+
+        # One reference date for every user, even if the run crosses midnight
+        today = date.today()
+        started = time.perf_counter()
+        print(f"Analyzing {len(user_ids)} users with {workers or os.cpu_count()} workers...")
+
+        failed = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            futures = [(user_id, executor.submit(analyze_user, user_id, chunk_size, today)) for user_id in user_ids]
+            # One user's failure is logged and skipped; the remaining users are still stored
+            for user_id, future in futures:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"User {user_id}: analysis failed: {e}")
+                    failed.append(user_id)
+                    continue
+
+                if not store_results(result):
+                    failed.append(user_id)
+                    continue
+                print(f"User {user_id}: {result['expense_count']} expenses, "
+                      f"{len(result['recurring'])} recurring, {len(result['anomalies'])} anomalies")
+
+        if failed:
+            print(f"{len(failed)} users failed: {failed}")
+        print(f"Insights job finished in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Detect recurring charges and anomalous expenses")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--chunk-size', type=int, default=1000, help="expenses read per database round trip")
+    parser.add_argument('--user', type=int, action='append', dest='user_ids', help="only analyze this user id")
+    args = parser.parse_args()
+
+    run(args.user_ids, args.workers, args.chunk_size)
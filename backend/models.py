@@ -72,6 +72,9 @@ class Expense(db.Model):
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     
+    # AUTOINCREMENT on SQLite, so ids of archived expenses are never handed out again
+    __table_args__ = {'sqlite_autoincrement': True}
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -108,4 +111,141 @@ class Budget(db.Model):
             'category_id': self.category_id,
             'category_name': self.category.name if self.category else None,
             'created_at': self.created_at.isoformat()
-        }
\ No newline at end of file
+        }
+
+class RecurringCharge(db.Model):
+    """Subscription-like charge detected by the insights batch job (insights_job.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=True)
+    description_key = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.String(200), nullable=False)
+    period = db.Column(db.String(20), nullable=False)  # weekly, biweekly, monthly, quarterly, yearly
+    average_amount = db.Column(db.Float, nullable=False)
+    occurrences = db.Column(db.Integer, nullable=False)
+    last_date = db.Column(db.Date, nullable=False)
+    next_expected_date = db.Column(db.Date, nullable=False)
+    confidence = db.Column(db.Float, nullable=False)
+    computed_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'description': self.description,
+            'category_id': self.category_id,
+            'period': self.period,
+            'average_amount': self.average_amount,
+            'occurrences': self.occurrences,
+            'last_date': self.last_date.isoformat(),
+            'next_expected_date': self.next_expected_date.isoformat(),
+            'confidence': self.confidence,
+            'computed_at': self.computed_at.isoformat()
+        }
+
+class ExpenseAnomaly(db.Model):
+    """Expense whose amount is unusual for its category, flagged by the insights batch job"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    expense_id = db.Column(db.Integer, db.ForeignKey('expense.id', ondelete='CASCADE'), nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=True)
+    amount = db.Column(db.Float, nullable=False)
+    expected_amount = db.Column(db.Float, nullable=False)
+    z_score = db.Column(db.Float, nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    description = db.Column(db.String(200), nullable=False)
+    computed_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'expense_id': self.expense_id,
+            'category_id': self.category_id,
+            'amount': self.amount,
+            'expected_amount': self.expected_amount,
+            'z_score': self.z_score,
+            'date': self.date.isoformat(),
+            'description': self.description,
+            'computed_at': self.computed_at.isoformat()
+        }
+
+class AIUsage(db.Model):
+    """Per-user daily count of Gemini calls and tokens, per route"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    route = db.Column(db.String(50), nullable=False)
+    day = db.Column(db.Date, nullable=False, index=True)
+    model_calls = db.Column(db.Integer, nullable=False, default=0)
+    prompt_tokens = db.Column(db.Integer, nullable=False, default=0)
+    response_tokens = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (db.UniqueConstraint('user_id', 'route', 'day', name='unique_usage_per_user_route_day'),)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'route': self.route,
+            'day': self.day.isoformat(),
+            'model_calls': self.model_calls,
+            'prompt_tokens': self.prompt_tokens,
+            'response_tokens': self.response_tokens
+        }
+
+class ArchivedExpense(db.Model):
+    """Expense moved out of the hot expense table by archive.py"""
+    id = db.Column(db.Integer, primary_key=True)
+    expense_id = db.Column(db.Integer, nullable=False, index=True)  # id it had in the expense table
+    amount = db.Column(db.Float, nullable=False)
+    description = db.Column(db.String(200), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    currency = db.Column(db.String(3), default='USD')
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    
+    category = db.relationship('Category')
+    
+    __table_args__ = (db.Index('ix_archived_expense_user_date', 'user_id', 'date'),)
+    
+    def to_dict(self):
+        return {
+            'id': self.expense_id,
+            'archive_id': self.id,
+            'amount': self.amount,
+            'description': self.description,
+            'date': self.date.isoformat(),
+            'currency': self.currency,
+            'user_id': self.user_id,
+            'category_id': self.category_id,
+            'category_name': self.category.name if self.category else None,
+            'category_color': self.category.color if self.category else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'archived': True
+        }
+
+class MonthlyRollup(db.Model):
+    """Per-category monthly totals of archived expenses"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)  # 1-12
+    total_amount = db.Column(db.Float, nullable=False, default=0)
+    expense_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    category = db.relationship('Category')
+    
+    __table_args__ = (db.UniqueConstraint('user_id', 'category_id', 'year', 'month', name='unique_rollup_per_category_month'),)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'category_id': self.category_id,
+            'category_name': self.category.name if self.category else None,
+            'year': self.year,
+            'month': self.month,
+            'total_amount': self.total_amount,
+            'expense_count': self.expense_count
+        }
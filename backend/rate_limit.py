@@ -0,0 +1,199 @@
+import math
+import threading
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import jsonify
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from models import db, AIUsage
+
+
+# ============== TOKEN BUCKET STORES ==============
+
+class InMemoryBucketStore:
+    """Token buckets kept in this process; fine for a single worker or local development"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, refill_per_second, cost=1):
+        """Try to take cost tokens. Returns (allowed, retry_after_seconds)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_per_second)
+
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                return True, 0.0
+
+            self._buckets[key] = (tokens, now)
+            return False, (cost - tokens) / refill_per_second
+
+
+class RedisBucketStore:
+    """Token buckets shared by every worker through Redis; the update runs atomically in Lua"""
+
+    SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local cost = tonumber(ARGV[4])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+    local allowed = 0
+    local retry_after = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        allowed = 1
+    else
+        retry_after = (cost - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) * 2)
+    return {allowed, tostring(retry_after)}
+    """
+
+    def __init__(self, url, prefix='ratelimit:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_STORE points at Redis but the 'redis' package is not installed")
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    def take(self, key, capacity, refill_per_second, cost=1):
+        allowed, retry_after = self._script(
+            keys=[self.prefix + key],
+            args=[capacity, refill_per_second, time.time(), cost]
+        )
+        return bool(allowed), float(retry_after)
+
+
+def create_bucket_store(url):
+    """'memory' (default) for an in-process store, or a redis:// URL for a shared one"""
+    if url and url.startswith(('redis://', 'rediss://')):
+        return RedisBucketStore(url)
+    return InMemoryBucketStore()
+
+
+def parse_limit(value):
+    """Parse '30/60' (30 requests per 60 seconds) into (capacity, refill_per_second)"""
+    requests, seconds = value.split('/')
+    return int(requests), int(requests) / float(seconds)
+
+
+class RateLimiter:
+    def __init__(self, store):
+        self.store = store
+
+    def limit(self, route, limit):
+        """
+        Per-user, per-route token bucket. Must be applied below @jwt_required()
+        so the user identity is available. limit is a '<requests>/<seconds>' string.
+        """
+        capacity, refill_per_second = parse_limit(limit)
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                key = f"{route}:{get_jwt_identity()}"
+                allowed, retry_after = self.store.take(key, capacity, refill_per_second)
+
+                if not allowed:
+                    retry_after = max(1, math.ceil(retry_after))
+                    print(f"Rate limit exceeded for {key}, retry in {retry_after}s")
+                    response = jsonify({'error': 'Rate limit exceeded', 'retry_after': retry_after})
+                    response.headers['Retry-After'] = str(retry_after)
+                    return response, 429
+
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
+
+
+# ============== QUOTA ACCOUNTING ==============
+
+def record_model_call(user_id, route, prompt_tokens, response_tokens):
+    """
+    Add one model call and its token counts to the user's usage row for today (UTC).
+    The counters are incremented in SQL so concurrent requests can't lose an update;
+    the row is only inserted when the update found none.
+    """
+    today = datetime.now(timezone.utc).date()
+
+    for attempt in range(2):
+        try:
+            updated = AIUsage.query.filter_by(user_id=user_id, route=route, day=today).update({
+                AIUsage.model_calls: AIUsage.model_calls + 1,
+                AIUsage.prompt_tokens: AIUsage.prompt_tokens + prompt_tokens,
+                AIUsage.response_tokens: AIUsage.response_tokens + response_tokens
+            }, synchronize_session=False)
+            if not updated:
+                db.session.add(AIUsage(user_id=user_id, route=route, day=today, model_calls=1,
+                                       prompt_tokens=prompt_tokens, response_tokens=response_tokens))
+            db.session.commit()
+            return
+        except IntegrityError:
+            # Another request created today's row first; retry as an update
+            db.session.rollback()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Usage accounting error: {e}")
+            return
+
+
+def failed_attempt_recorder(user_id, route, prompt, estimate_tokens):
+    """
+    on_failed_attempt callback for ai_client. Failed, timed-out and retried attempts
+    still reach Gemini, so each one is counted as a call with the prompt's tokens.
+    """
+    def record(error):
+        record_model_call(user_id, route, estimate_tokens(prompt), 0)
+    return record
+
+
+def token_counts(response, prompt, response_text, estimate_tokens):
+    """Token counts from Gemini's usage metadata, estimated from text when it is missing"""
+    usage = getattr(response, 'usage_metadata', None)
+    prompt_tokens = getattr(usage, 'prompt_token_count', None)
+    response_tokens = getattr(usage, 'candidates_token_count', None)
+    return (
+        prompt_tokens if prompt_tokens is not None else estimate_tokens(prompt),
+        response_tokens if response_tokens is not None else estimate_tokens(response_text)
+    )
+
+
+def usage_summary(start_date, end_date, user_id=None):
+    """Daily model calls and tokens per route, optionally for one user, for capacity planning"""
+    query = db.session.query(
+        AIUsage.day,
+        AIUsage.route,
+        func.count(func.distinct(AIUsage.user_id)),
+        func.sum(AIUsage.model_calls),
+        func.sum(AIUsage.prompt_tokens),
+        func.sum(AIUsage.response_tokens)
+    ).filter(AIUsage.day.between(start_date, end_date))
+
+    if user_id is not None:
+        query = query.filter(AIUsage.user_id == user_id)
+
+    rows = query.group_by(AIUsage.day, AIUsage.route).order_by(AIUsage.day, AIUsage.route).all()
+    return [
+        {
+            'day': day.isoformat(),
+            'route': route,
+            'active_users': users,
+            'model_calls': int(calls or 0),
+            'prompt_tokens': int(prompt_tokens or 0),
+            'response_tokens': int(response_tokens or 0)
+        } for day, route, users, calls, prompt_tokens, response_tokens in rows
+    ]
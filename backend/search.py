@@ -0,0 +1,167 @@
+import difflib
+import re
+
+from sqlalchemy import text
+
+from models import db, Expense
+
+
+# Which index backs search; set by setup_search_index() at startup
+SEARCH_BACKEND = {'name': 'like'}
+
+SQLITE_FTS_SETUP = [
+    # External-content table: the text lives in expense, the index only stores tokens
+    """CREATE VIRTUAL TABLE IF NOT EXISTS expense_fts USING fts5(
+        description, content='expense', content_rowid='id',
+        tokenize='porter unicode61', prefix='2 3'
+    )""",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS expense_fts_vocab USING fts5vocab(expense_fts, 'row')",
+    # Triggers keep the index in sync for every write path, not just the API routes
+    """CREATE TRIGGER IF NOT EXISTS expense_fts_insert AFTER INSERT ON expense BEGIN
+        INSERT INTO expense_fts(rowid, description) VALUES (new.id, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS expense_fts_delete AFTER DELETE ON expense BEGIN
+        INSERT INTO expense_fts(expense_fts, rowid, description) VALUES ('delete', old.id, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS expense_fts_update AFTER UPDATE OF description ON expense BEGIN
+        INSERT INTO expense_fts(expense_fts, rowid, description) VALUES ('delete', old.id, old.description);
+        INSERT INTO expense_fts(rowid, description) VALUES (new.id, new.description);
+    END""",
+]
+
+POSTGRES_SEARCH_SETUP = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    # Generated column, so Postgres keeps it in sync on insert/update by itself
+    """ALTER TABLE expense ADD COLUMN IF NOT EXISTS description_tsv tsvector
+        GENERATED ALWAYS AS (to_tsvector('simple', coalesce(description, ''))) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_expense_description_tsv ON expense USING gin (description_tsv)",
+    "CREATE INDEX IF NOT EXISTS ix_expense_description_trgm ON expense USING gin (description gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_expense_user_date ON expense (user_id, date)",
+]
+
+
+def setup_search_index(engine):
+    """Create the full-text index for the current database; falls back to LIKE if unsupported"""
+    dialect = engine.dialect.name
+
+    try:
+        with engine.begin() as conn:
+            if dialect == 'sqlite':
+                existed = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'expense_fts'")
+                ).first() is not None
+                for statement in SQLITE_FTS_SETUP:
+                    conn.execute(text(statement))
+                if not existed:
+                    # Index rows that were written before the index existed
+                    conn.execute(text("INSERT INTO expense_fts(expense_fts) VALUES ('rebuild')"))
+                SEARCH_BACKEND['name'] = 'sqlite_fts5'
+            elif dialect == 'postgresql':
+                for statement in POSTGRES_SEARCH_SETUP:
+                    conn.execute(text(statement))
+                SEARCH_BACKEND['name'] = 'postgres'
+        print(f"Search index ready ({SEARCH_BACKEND['name']})")
+    except Exception as e:
+        SEARCH_BACKEND['name'] = 'like'
+        print(f"Search index setup error, using LIKE search: {e}")
+
+
+def tokenize_query(query):
+    return re.findall(r"\w+", query.lower())
+
+
+def _sqlite_fuzzy_terms(conn, terms):
+    """Replace each term with close spellings from the index vocabulary ("amazn" -> "amazon")"""
+    corrected = []
+    for term in terms:
+        candidates = [row[0] for row in conn.execute(
+            text("SELECT term FROM expense_fts_vocab WHERE term >= :first AND term < :next"),
+            {'first': term[0], 'next': chr(ord(term[0]) + 1)}
+        )]
+        matches = difflib.get_close_matches(term, candidates, n=3, cutoff=0.75)
+        corrected.append(matches or [term])
+    return corrected
+
+
+def _sqlite_search(user_id, terms, limit, offset):
+    def run(groups):
+        # Each group is OR'd alternatives for one query word; words are AND'd, all prefix matches
+        match = ' AND '.join(
+            '(' + ' OR '.join(f'"{term}"*' for term in group) + ')' for group in groups
+        )
+        params = {'match': match, 'user_id': user_id, 'limit': limit, 'offset': offset}
+        total = db.session.execute(text("""
+            SELECT count(*) FROM expense_fts JOIN expense ON expense.id = expense_fts.rowid
+            WHERE expense_fts MATCH :match AND expense.user_id = :user_id
+        """), params).scalar()
+        rows = db.session.execute(text("""
+            SELECT expense.id, -bm25(expense_fts) AS rank
+            FROM expense_fts JOIN expense ON expense.id = expense_fts.rowid
+            WHERE expense_fts MATCH :match AND expense.user_id = :user_id
+            ORDER BY bm25(expense_fts), expense.date DESC
+            LIMIT :limit OFFSET :offset
+        """), params).all()
+        return rows, total
+
+    rows, total = run([[term] for term in terms])
+    if total == 0:
+        rows, total = run(_sqlite_fuzzy_terms(db.session, terms))
+    return rows, total
+
+
+def _postgres_search(user_id, query, terms, limit, offset):
+    # Typos are matched with word similarity (query vs. the closest words of the description),
+    # so "amazn" still finds "Amazon order 12"; whole-string similarity would be far below threshold
+    rows = db.session.execute(text("""
+        SELECT id, rank, count(*) OVER () AS total FROM (
+            SELECT expense.id, expense.date,
+                   ts_rank(description_tsv, to_tsquery('simple', :tsquery)) + word_similarity(:query, description) AS rank
+            FROM expense
+            WHERE expense.user_id = :user_id
+              AND (description_tsv @@ to_tsquery('simple', :tsquery) OR :query <% description)
+        ) matches
+        ORDER BY rank DESC, date DESC
+        LIMIT :limit OFFSET :offset
+    """), {
+        'tsquery': ' & '.join(f"{term}:*" for term in terms),
+        'query': query,
+        'user_id': user_id,
+        'limit': limit,
+        'offset': offset
+    }).all()
+    total = rows[0].total if rows else 0
+    return [(row.id, row.rank) for row in rows], total
+
+
+def _like_search(user_id, terms, limit, offset):
+    filters = [Expense.user_id == user_id] + [Expense.description.ilike(f"%{term}%") for term in terms]
+    base = Expense.query.filter(*filters)
+    total = base.count()
+    expenses = base.order_by(Expense.date.desc()).limit(limit).offset(offset).all()
+    return [(expense.id, None) for expense in expenses], total
+
+
+def search_expenses(user_id, query, page=1, per_page=20):
+    """
+    Ranked, paginated search over a user's expense descriptions.
+    Returns (list of (Expense, rank), total match count).
+    """
+    terms = tokenize_query(query)
+    if not terms:
+        return [], 0
+
+    limit = per_page
+    offset = (page - 1) * per_page
+    backend = SEARCH_BACKEND['name']
+
+    if backend == 'sqlite_fts5':
+        rows, total = _sqlite_search(user_id, terms, limit, offset)
+    elif backend == 'postgres':
+        rows, total = _postgres_search(user_id, query, terms, limit, offset)
+    else:
+        rows, total = _like_search(user_id, terms, limit, offset)
+
+    # Load the page of expenses in one query and keep the ranked order
+    ids = [row[0] for row in rows]
+    expenses = {expense.id: expense for expense in Expense.query.filter(Expense.id.in_(ids)).all()} if ids else {}
+    return [(expenses[row[0]], row[1]) for row in rows if row[0] in expenses], total
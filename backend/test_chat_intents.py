@@ -0,0 +1,67 @@
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+from chat_intents import classify
+
+TODAY = date(2026, 10, 19)
+
+CATEGORIES = [
+    SimpleNamespace(id=index, name=name) for index, name in enumerate([
+        'Food & Dining', 'Transportation', 'Entertainment', 'Shopping',
+        'Bills & Utilities', 'Healthcare', 'Other'
+    ], start=1)
+]
+
+
+@pytest.mark.parametrize('message, intent, period, category', [
+    ("How much did I spend this month?", 'total_spent', 'this month', None),
+    ("How much have I spent?", 'total_spent', None, None),
+    ("how much did I spend on food last month", 'total_spent', 'last month', 'Food & Dining'),
+    ("What did I spend on Food & Dining today?", 'total_spent', 'today', 'Food & Dining'),
+    ("how much have I spent in total", 'total_spent', 'in total', None),
+    ("total spending in the last 7 days", 'total_spent', 'in the last 7 days', None),
+    ("how much did I spend in March", 'total_spent', 'in March 2026', None),
+    ("How many transactions this week?", 'expense_count', 'this week', None),
+    ("What's my average expense this year?", 'average_expense', 'this year', None),
+    ("What is my top category this month?", 'top_category', 'this month', None),
+    ("Show me my spending by category last week", 'category_breakdown', 'last week', None),
+    ("What was my biggest purchase this year?", 'largest_expense', 'this year', None),
+    ("What are my recent expenses?", 'recent_expenses', None, None),
+])
+def test_answered_locally(message, intent, period, category):
+    classified = classify(message, CATEGORIES, TODAY)
+    assert classified is not None
+    assert classified[0] == intent
+    date_range = classified[1]['date_range']
+    assert (date_range[2] if date_range else None) == period
+    assert (classified[1]['category'].name if classified[1]['category'] else None) == category
+
+
+@pytest.mark.parametrize('message', [
+    # Periods the slots can't express
+    "how much did I spend in 2023",
+    "how much did I spend in the last 3 months",
+    "how much did I spend last quarter",
+    "how much did I spend in the past two weeks",
+    "how much did I spend last weekend",
+    "how much did I spend on 3/15",
+    "spending between march and may",
+    "how much have I spent since January",
+    "how much did I spend in March and April",
+    "how much did I spend in the last 0 days",
+    # Subjects that aren't categories
+    "how much is my rent?",
+    "how much did uber cost me",
+    "amazon total this year",
+    "how much did I spend on Netflix",
+    "how much did I spend on food and transportation",
+    # Comparisons, rates and advice
+    "did I spend more than last month",
+    "how much do I spend per day",
+    "what did I spend the most on?",
+    "how can I save money",
+])
+def test_escalated_to_model(message):
+    assert classify(message, CATEGORIES, TODAY) is None
@@ -56,7 +56,7 @@ const FinancialAssistant = () => {
 
             console.log('Sending chat message:', currentMessage);
 
-            const response = await fetch('http://localhost:5000/api/chat', {
+            const response = await fetch('http://localhost:5000/api/chat/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -75,17 +75,49 @@ const FinancialAssistant = () => {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
 
-            const data = await response.json();
-            console.log('Chat response data:', data);
-
-            const botMessage = {
-                id: Date.now() + 1,
-                text: data.response,
+            // The response is newline-delimited JSON; show tokens as they arrive
+            const botMessageId = Date.now() + 1;
+            setMessages(prev => [...prev, {
+                id: botMessageId,
+                text: '',
                 sender: 'bot',
                 timestamp: new Date()
+            }]);
+
+            const updateBotMessage = (update) => {
+                setMessages(prev => prev.map(msg =>
+                    msg.id === botMessageId ? { ...msg, text: update(msg.text) } : msg
+                ));
             };
 
-            setMessages(prev => [...prev, botMessage]);
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+
+                for (const line of lines) {
+                    if (!line.trim()) continue;
+                    const event = JSON.parse(line);
+
+                    if (event.type === 'context') {
+                        console.log('Chat context used:', event.context_used);
+                    } else if (event.type === 'token') {
+                        setIsTyping(false);
+                        updateBotMessage(text => text + event.text);
+                    } else if (event.type === 'fallback') {
+                        // The model failed, possibly mid-answer; replace any partial text
+                        updateBotMessage(() => event.response);
+                    }
+                }
+            }
+
             setIsTyping(false);
 
         } catch (error) {